@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Deal Threshold Backtester
+Replays the server's deal detection over stored price history for a grid of
+parameters and reports alert volume, precision and simulated savings
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+# Keep temporary (row x column) blocks under this many cells
+MAX_BLOCK_CELLS = 50_000_000
+# Rows per block when ranking prices against trailing history
+BLOCK_SIZE = 64
+
+
+def default_data_dir():
+    """Return the server's data directory (one level up from scripts)"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(current_dir), 'data')
+
+
+def parse_values(text):
+    """Parse a comma separated list of floats"""
+    return np.array([float(value) for value in text.split(',') if value.strip()])
+
+
+def live_segments(route_dir):
+    """List a route's snapshot segments oldest first, skipping segments
+    already covered by a merged one (same rule as the server)"""
+    segments = []
+    for filename in os.listdir(route_dir):
+        match = re.match(r'^(\d+)-(\d+)-(\d+)\.json$', filename)
+        if match:
+            segments.append({
+                'file': os.path.join(route_dir, filename),
+                'since': int(match.group(1)),
+                'through': int(match.group(2))
+            })
+
+    segments.sort(key=lambda segment: (segment['since'], -segment['through']))
+    live = []
+    for segment in segments:
+        if not live or segment['since'] >= live[-1]['through']:
+            live.append(segment)
+    return live
+
+
+def load_price_history(data_dir):
+    """Load route snapshots and the observation log into columnar arrays"""
+    route_names = []
+    route_index = {}
+    columns = {'route': [], 't': [], 'depart': [], 'return': [], 'price': []}
+    through = {}
+
+    def get_route_index(route):
+        if route not in route_index:
+            route_index[route] = len(route_names)
+            route_names.append(route)
+        return route_index[route]
+
+    # Compacted snapshot segments, one directory per route
+    for route_dir in sorted(glob.glob(os.path.join(data_dir, 'price-history', '*', ''))):
+        for segment in live_segments(route_dir):
+            with open(segment['file'], 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            index = get_route_index(data['route'])
+            through[data['route']] = segment['through']
+            columns['route'].append(np.full(len(data['price']), index, dtype=np.int32))
+            columns['t'].append(np.array(data['t'], dtype=np.int64))
+            columns['depart'].append(np.array(data['depart'], dtype='datetime64[D]'))
+            columns['return'].append(np.array(data['return'], dtype='datetime64[D]'))
+            columns['price'].append(np.array(data['price'], dtype=np.float64))
+
+    # Observations not yet compacted
+    log_file = os.path.join(data_dir, 'price-log.ndjson')
+    if os.path.exists(log_file):
+        rows = {'route': [], 't': [], 'depart': [], 'return': [], 'price': []}
+        with open(log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    observation = json.loads(line)
+                except ValueError:
+                    continue  # Partially written trailing line
+                if observation['t'] <= through.get(observation['route'], 0):
+                    continue
+                rows['route'].append(get_route_index(observation['route']))
+                rows['t'].append(observation['t'])
+                rows['depart'].append(observation['depart'])
+                rows['return'].append(observation['return'])
+                rows['price'].append(observation['price'])
+
+        columns['route'].append(np.array(rows['route'], dtype=np.int32))
+        columns['t'].append(np.array(rows['t'], dtype=np.int64))
+        columns['depart'].append(np.array(rows['depart'], dtype='datetime64[D]'))
+        columns['return'].append(np.array(rows['return'], dtype='datetime64[D]'))
+        columns['price'].append(np.array(rows['price'], dtype=np.float64))
+
+    # An empty or unreadable log alone still leaves zero rows
+    if sum(len(prices) for prices in columns['price']) == 0:
+        return None
+
+    history = {name: np.concatenate(parts) for name, parts in columns.items()}
+    history['route_names'] = route_names
+    return history
+
+
+def iso_week(dates):
+    """ISO week number for an array of datetime64[D] dates"""
+    days = dates.astype(np.int64)
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday, Monday = 0
+    thursday = dates - weekday + 3
+    year_start = thursday.astype('datetime64[Y]').astype('datetime64[D]')
+    return (thursday - year_start).astype(np.int64) // 7 + 1
+
+
+def sketch_keys(price, accuracy):
+    """Bucket prices the way the server's quantile sketch does"""
+    gamma = (1 + accuracy) / (1 - accuracy)
+    return np.ceil(np.log(np.maximum(price, 1)) / np.log(gamma)).astype(np.int64)
+
+
+def group_starts(keys):
+    """For keys sorted into contiguous groups, return (group id, offset in group)"""
+    is_start = np.ones(len(keys), dtype=bool)
+    is_start[1:] = keys[1:] != keys[:-1]
+    group_id = np.cumsum(is_start) - 1
+    start_positions = np.flatnonzero(is_start)
+    offset = np.arange(len(keys)) - start_positions[group_id]
+    return group_id, offset
+
+
+def trailing_stats(group, t, price, window):
+    """Mean, standard deviation and sample count of the prior prices in each
+    observation's group, over at most `window` prior observations"""
+    order = np.lexsort((t, group))
+    price = price[order]
+    group_id, offset = group_starts(group[order])
+
+    # Center on the group mean so the running sums stay well conditioned
+    group_mean = np.bincount(group_id, price) / np.bincount(group_id)
+    centered = price - group_mean[group_id]
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+
+    positions = np.arange(len(price))
+    count = np.minimum(offset, window)
+    safe_count = np.maximum(count, 1)
+    window_mean = (sums[positions] - sums[positions - count]) / safe_count
+    window_square = (squares[positions] - squares[positions - count]) / safe_count
+    variance = np.maximum(window_square - window_mean * window_mean, 0)
+
+    mean = np.empty_like(price)
+    std = np.empty_like(price)
+    samples = np.empty(len(price), dtype=np.int64)
+    mean[order] = window_mean + group_mean[group_id]
+    std[order] = np.sqrt(variance)
+    samples[order] = offset
+    return mean, std, samples
+
+
+def trailing_percentile(group, t, keys, window, query, block=BLOCK_SIZE):
+    """Fraction of prior prices in each queried observation's group that fall
+    in a lower sketch bucket (half for the same bucket), like the server's
+    sketchPercentile. Prior prices are the rest of the observation's block
+    of `block` rows plus the ceil(window / block) full blocks before it."""
+    order = np.lexsort((t, group))
+    key = (keys[order] - keys.min()).astype(np.int16)
+    wanted = query[order]
+    _, offset = group_starts(group[order])
+
+    # Every group starts a new block, so block ids are global and contiguous
+    position = offset % block
+    block_id = np.cumsum(position == 0) - 1
+    block_in_group = offset // block
+    blocks = block_id[-1] + 1
+
+    # lower[b, k] = rows of block b in a bucket below k, built a chunk of blocks at a time
+    buckets = int(key.max()) + 2
+    lower = np.empty((blocks, buckets), dtype=np.uint8)
+    chunk = max(1, MAX_BLOCK_CELLS // buckets)
+    row_bounds = np.searchsorted(block_id, np.arange(0, blocks + chunk, chunk))
+    for first in range(0, blocks, chunk):
+        last = min(first + chunk, blocks)
+        start, end = row_bounds[first // chunk], row_bounds[first // chunk + 1]
+        counts = np.bincount((block_id[start:end] - first) * buckets + key[start:end] + 1,
+                             minlength=(last - first) * buckets)
+        lower[first:last] = np.cumsum(counts.reshape(-1, buckets), axis=1)
+
+    rows = np.flatnonzero(wanted)
+    row_key = key[rows].astype(np.int64)
+    below = np.zeros(len(rows))
+    counted = position[rows].astype(np.float64)
+    for back in range(1, -(-window // block) + 1):
+        has_block = block_in_group[rows] >= back
+        source = block_id[rows[has_block]] - back
+        k = row_key[has_block]
+        less = lower[source, k].astype(np.int64)
+        below[has_block] += less + 0.5 * (lower[source, k + 1] - less)
+        counted[has_block] += block
+
+    # Earlier rows of the same block, compared directly a chunk of rows at a time
+    padded = np.full((blocks, block), -1, dtype=np.int16)
+    padded[block_id, position] = key
+    columns = np.arange(block)
+    chunk = max(1, MAX_BLOCK_CELLS // block)
+    for start in range(0, len(rows), chunk):
+        part = rows[start:start + chunk]
+        theirs = padded[block_id[part]]
+        mine = key[part][:, None]
+        earlier = columns[None, :] < position[part][:, None]
+        below[start:start + chunk] += (((theirs < mine) & earlier).sum(axis=1)
+                                       + 0.5 * ((theirs == mine) & earlier).sum(axis=1))
+
+    percentile = np.full(len(key), np.nan)
+    has_prior = counted > 0
+    percentile[rows[has_prior]] = below[has_prior] / counted[has_prior]
+
+    result = np.empty_like(percentile)
+    result[order] = percentile
+    return result
+
+
+def hindsight(history, tolerance):
+    """Whether each price was within `tolerance` of the lowest later price for
+    the same itinerary, whether there was any later price to judge it by, and
+    the itinerary's average price"""
+    depart_days = history['depart'].astype(np.int64)
+    stay = (history['return'] - history['depart']).astype(np.int64)
+    key = (history['route'].astype(np.int64) << 32) | (depart_days << 10) | (stay & 1023)
+
+    order = np.lexsort((history['t'], key))
+    price = history['price'][order]
+    itinerary, offset = group_starts(key[order])
+    sizes = np.bincount(itinerary)
+
+    # Suffix minimum per itinerary: walk backwards in time, and shift each
+    # earlier-walked itinerary above every later one so minima never leak
+    reversed_price = price[::-1]
+    reversed_group = itinerary[::-1]
+    shift = (reversed_price.max() - reversed_price.min() + 1) * (itinerary[-1] - reversed_group)
+    future_min = np.minimum.accumulate(reversed_price - shift)[::-1] + shift[::-1]
+
+    itinerary_mean = np.bincount(itinerary, price) / sizes
+
+    good = np.empty(len(price), dtype=bool)
+    resolved = np.empty(len(price), dtype=bool)
+    typical = np.empty_like(price)
+    good[order] = price <= future_min * (1 + tolerance)
+    resolved[order] = offset < sizes[itinerary] - 1
+    typical[order] = itinerary_mean[itinerary]
+    return good, resolved, typical
+
+
+def backtest(history, rule, rule_values, deal_thresholds, window, min_route_samples, min_week_samples,
+             accuracy, tolerance):
+    """Evaluate every (rule value, dealThreshold) pair in one vectorized pass.
+    Both parameter lists must be sorted ascending."""
+    price = history['price']
+    t = history['t']
+    route_group = history['route'].astype(np.int64)
+    week_group = route_group * 54 + iso_week(history['depart'])
+
+    # Like scorePrice: the departure week once it has enough samples, else the route
+    route_mean, route_std, route_samples = trailing_stats(route_group, t, price, window)
+    week_mean, week_std, week_samples = trailing_stats(week_group, t, price, window)
+    use_week = week_samples >= min_week_samples
+    scored = use_week | (route_samples >= min_route_samples)
+    mean = np.where(use_week, week_mean, route_mean)
+    std = np.where(use_week, week_std, route_std)
+
+    deal_score = (mean - price) / np.where(mean > 0, mean, 1)
+    possible = scored & (price < mean) & (deal_score >= deal_thresholds.min())
+
+    if rule == 'percentile':
+        keys = sketch_keys(price, accuracy)
+        score = np.where(
+            use_week,
+            trailing_percentile(week_group, t, keys, window, possible & use_week),
+            trailing_percentile(route_group, t, keys, window, possible & ~use_week)
+        )
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = np.where(std > 0, (price - mean) / std, 0.0)
+
+    good, resolved, typical = hindsight(history, tolerance)
+
+    # Only observations that can alert under the loosest combination matter
+    candidates = np.flatnonzero(possible & (score <= rule_values[-1]))
+
+    # Both parameters are thresholds, so an observation alerts for every rule
+    # value from the first one >= its score, and every dealThreshold up to the
+    # last one <= its dealScore. Count each observation once in that corner
+    # cell, then cumulative sums give the totals for every combination.
+    rules = len(rule_values)
+    thresholds = len(deal_thresholds)
+    routes = len(history['route_names'])
+    first_rule = np.searchsorted(rule_values, score[candidates], 'left')
+    last_threshold = np.searchsorted(deal_thresholds, deal_score[candidates], 'right') - 1
+    cell = (history['route'][candidates].astype(np.int64) * rules + first_rule) * thresholds + last_threshold
+
+    def accumulate(weights=None):
+        counts = np.bincount(cell, weights=weights, minlength=routes * rules * thresholds)
+        counts = counts.reshape(routes, rules, thresholds).cumsum(axis=1)
+        counts = counts[:, :, ::-1].cumsum(axis=2)[:, :, ::-1]
+        return counts.reshape(routes, rules * thresholds).T.astype(np.float64)
+
+    rule_grid, threshold_grid = np.meshgrid(rule_values, deal_thresholds, indexing='ij')
+    return {
+        'rule_values': rule_grid.ravel(),
+        'deal_thresholds': threshold_grid.ravel(),
+        'alerts': accumulate(),
+        'judged': accumulate(resolved[candidates]),
+        'hits': accumulate(good[candidates] & resolved[candidates]),
+        'savings': accumulate(typical[candidates] - price[candidates])
+    }
+
+
+def precision_of(hits, judged):
+    """Share of judged alerts that were correct (0 when nothing was judged)"""
+    return np.divide(hits, judged, out=np.zeros_like(hits), where=judged > 0)
+
+
+def print_summary(results, rule, days, top, min_alerts):
+    """Print the best parameter combinations across all routes"""
+    alerts = results['alerts'].sum(axis=1)
+    judged = results['judged'].sum(axis=1)
+    hits = results['hits'].sum(axis=1)
+    savings = results['savings'].sum(axis=1)
+    precision = precision_of(hits, judged)
+
+    # Most precise first, then the most savings, among combinations with
+    # enough judged alerts for the precision to mean something
+    eligible = judged >= min_alerts
+    if not eligible.any():
+        print(f"\nNo combination has {min_alerts} judged alerts, ranking all that alerted")
+        eligible = alerts > 0
+    ranking = np.lexsort((-savings, -precision))
+    ranking = ranking[eligible[ranking]][:top]
+
+    label = 'dealPercentile' if rule == 'percentile' else 'dealZScore'
+    print(f"\n{label:>14} {'dealThreshold':>14} {'alerts':>10} {'per day':>9} {'judged':>10} {'precision':>10} {'savings':>14}")
+    for i in ranking:
+        print(f"{results['rule_values'][i]:>14.3f} {results['deal_thresholds'][i]:>14.3f} "
+              f"{int(alerts[i]):>10} {alerts[i] / days:>9.1f} {int(judged[i]):>10} "
+              f"{precision[i]:>10.1%} {savings[i]:>14,.0f}")
+
+    return ranking[0] if len(ranking) > 0 else None
+
+
+def print_routes(results, route_names, combo, top):
+    """Print per-route results for one parameter combination"""
+    alerts = results['alerts'][combo]
+    judged = results['judged'][combo]
+    precision = precision_of(results['hits'][combo], judged)
+    savings = results['savings'][combo]
+
+    print(f"\nPer-route results for dealPercentile/dealZScore={results['rule_values'][combo]:.3f}, "
+          f"dealThreshold={results['deal_thresholds'][combo]:.3f}")
+    print(f"{'route':>12} {'alerts':>10} {'judged':>10} {'precision':>10} {'savings':>14}")
+    for route in np.argsort(-alerts)[:top]:
+        if alerts[route] == 0:
+            break
+        print(f"{route_names[route]:>12} {int(alerts[route]):>10} {int(judged[route]):>10} "
+              f"{precision[route]:>10.1%} {savings[route]:>14,.0f}")
+
+
+def write_routes_csv(results, route_names, filename):
+    """Write every (parameter combination, route) result to a CSV file"""
+    precision = precision_of(results['hits'], results['judged'])
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rule_value', 'deal_threshold', 'route', 'alerts', 'judged', 'precision', 'savings'])
+        for combo, route in zip(*np.nonzero(results['alerts'])):
+            writer.writerow([
+                f"{results['rule_values'][combo]:.4f}",
+                f"{results['deal_thresholds'][combo]:.4f}",
+                route_names[route],
+                int(results['alerts'][combo, route]),
+                int(results['judged'][combo, route]),
+                f"{precision[combo, route]:.4f}" if results['judged'][combo, route] > 0 else '',
+                f"{results['savings'][combo, route]:.2f}"
+            ])
+    print(f"\nPer-route results written to {filename}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest deal detection thresholds over stored price history')
+    parser.add_argument('--data-dir', default=default_data_dir(), help='Server data directory')
+    parser.add_argument('--rule', choices=['percentile', 'zscore'], default='percentile',
+                        help='Deal rule to replay (STATS_CONFIG.dealRule)')
+    parser.add_argument('--values', help='Comma separated dealPercentile (or dealZScore) values')
+    parser.add_argument('--thresholds', default='0,0.05,0.1,0.15,0.2,0.25,0.3,0.4,0.5',
+                        help='Comma separated dealThreshold values (minimum dealScore to email)')
+    parser.add_argument('--window', type=int, default=500, help='Prior observations in the trailing stats (STATS_CONFIG.window)')
+    parser.add_argument('--min-route-samples', type=int, default=5, help='STATS_CONFIG.minRouteSamples')
+    parser.add_argument('--min-week-samples', type=int, default=10, help='STATS_CONFIG.minWeekSamples')
+    parser.add_argument('--accuracy', type=float, default=0.01, help='STATS_CONFIG.sketchAccuracy')
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='An alert is correct if no later price for the itinerary beat it by more than this')
+    parser.add_argument('--min-alerts', type=int, default=50,
+                        help='Judged alerts a combination needs to be ranked')
+    parser.add_argument('--top', type=int, default=20, help='Rows to print')
+    parser.add_argument('--routes-csv', help='Write per-route results for every combination to this CSV file')
+    args = parser.parse_args()
+
+    if args.values:
+        rule_values = parse_values(args.values)
+    elif args.rule == 'percentile':
+        rule_values = np.array([0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3])
+    else:
+        rule_values = np.array([-3.0, -2.5, -2.0, -1.64, -1.28, -1.0, -0.75, -0.5])
+    rule_values = np.unique(rule_values)
+    deal_thresholds = np.unique(parse_values(args.thresholds))
+
+    started = time.time()
+    history = load_price_history(args.data_dir)
+    if history is None:
+        print(f"No price history found in {args.data_dir}")
+        return
+    loaded = time.time()
+
+    days = max((history['t'].max() - history['t'].min()) / 86_400_000, 1)
+    print(f"Loaded {len(history['price']):,} observations across {len(history['route_names']):,} routes "
+          f"({days:.0f} days) in {loaded - started:.1f}s")
+
+    results = backtest(history, args.rule, rule_values, deal_thresholds, args.window,
+                       args.min_route_samples, args.min_week_samples, args.accuracy, args.tolerance)
+    print(f"Evaluated {len(results['rule_values'])} parameter combinations in {time.time() - loaded:.1f}s")
+    print("Differences from the server: means and deviations use a plain trailing window rather than exponential\n"
+          f"weighting, and percentiles rank against the last {args.window}-{args.window + BLOCK_SIZE} observations "
+          "rather than the decaying sketch.\n"
+          "Alerts with no later price for the same itinerary are counted but not judged for precision.")
+
+    best = print_summary(results, args.rule, days, args.top, args.min_alerts)
+    if best is None:
+        print("\nNo combination produced any alerts")
+        return
+
+    print_routes(results, history['route_names'], best, args.top)
+    if args.routes_csv:
+        write_routes_csv(results, history['route_names'], args.routes_csv)
+
+
+if __name__ == "__main__":
+    main()
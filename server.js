@@ -17,14 +17,23 @@ app.use(express.json());
 app.use(express.static(path.join(__dirname, 'public')));
 
 // Data directories
-const DATA_DIR = path.join(__dirname, 'data');
+const DATA_DIR = process.env.DATA_DIR || path.join(__dirname, 'data');
 const DEALS_FILE = path.join(DATA_DIR, 'deals.json');
-const HISTORY_FILE = path.join(DATA_DIR, 'price-history.json');
+const HISTORY_FILE = path.join(DATA_DIR, 'price-history.json'); // Legacy, read-only
 const SETTINGS_FILE = path.join(DATA_DIR, 'settings.json');
+const PRICE_LOG_FILE = path.join(DATA_DIR, 'price-log.ndjson');
+const PRICE_SNAPSHOT_DIR = path.join(DATA_DIR, 'price-history');
+
+// Compact the observation log into route snapshots once it grows this large
+const PRICE_LOG_COMPACT_THRESHOLD = 10000;
+// Merge this many consecutive snapshot segments of similar size into one
+const SEGMENT_MERGE_FANOUT = 8;
+// Route histories kept in memory
+const ROUTE_CACHE_SIZE = 200;
 
 // In-memory data store
 let currentDeals = [];
-let priceHistory = {};
+let legacyPriceHistory = {};
 let settings = {
     baseAirport: 'LAX',
     maxPrice: 300,
@@ -59,10 +68,47 @@ const API_CONFIG = {
     }
 };
 
+// Provider search strategy
+// - sequential: try providers one after another (original behaviour)
+// - hedged: start the primary, launch the next provider after the hedge delay
+//   or on failure, take the first result and cancel the rest
+// - merge: query all providers in parallel and union their results
+const SEARCH_CONFIG = {
+    mode: process.env.SEARCH_MODE || 'hedged',
+    providerTimeoutMs: parseInt(process.env.PROVIDER_TIMEOUT_MS) || 15000,
+    hedgeDelayMs: parseInt(process.env.HEDGE_DELAY_MS) || 2000, // Used until enough latency samples exist
+    minHedgeDelayMs: 250,
+    maxHedgeDelayMs: 5000,
+    hedgePercentile: 0.95,
+    minLatencySamples: 20,
+    latencyWindow: 200, // Completed calls that dominate the latency histogram
+    unhealthyAfter: 3, // Consecutive cancelled or timed out calls before demoting a provider
+    demoteMs: 5 * 60 * 1000 // How long a demoted provider is tried last
+};
+
+// Price statistics used for deal detection
+// - a flight is a deal when its price falls in the bottom `dealPercentile` of
+//   observed prices (or `dealZScore` standard deviations below the mean)
+// - stats are kept per route and per route + departure week; the week is
+//   used once it has enough samples, otherwise the whole route
+const STATS_CONFIG = {
+    dealRule: 'percentile', // 'percentile' or 'zscore'
+    dealPercentile: 0.1,
+    dealZScore: -1.28,
+    window: 500, // Observations that dominate the rolling mean and variance
+    minRouteSamples: 5,
+    minWeekSamples: 10,
+    sketchAccuracy: 0.01 // Relative error of quantile estimates
+};
+
+// Latency histogram bucket upper bounds (ms)
+const LATENCY_BUCKETS = [50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 30000, Infinity];
+
 // Initialize data directory
 async function initDataDirectory() {
     try {
         await fs.mkdir(DATA_DIR, { recursive: true });
+        await fs.mkdir(PRICE_SNAPSHOT_DIR, { recursive: true });
         
         // Load existing data
         try {
@@ -74,10 +120,12 @@ async function initDataDirectory() {
         
         try {
             const historyData = await fs.readFile(HISTORY_FILE, 'utf8');
-            priceHistory = JSON.parse(historyData);
+            legacyPriceHistory = JSON.parse(historyData);
         } catch (err) {
-            console.log('No price history found');
+            console.log('No legacy price history found');
         }
+
+        await loadPriceLog();
         
         try {
             const settingsData = await fs.readFile(SETTINGS_FILE, 'utf8');
@@ -90,22 +138,501 @@ async function initDataDirectory() {
     }
 }
 
+// Write to a temporary file and rename so readers never see a partial file
+let tmpFileCounter = 0;
+
+async function writeFileAtomic(file, data) {
+    const tmpFile = `${file}.${process.pid}.${++tmpFileCounter}.tmp`;
+    await fs.writeFile(tmpFile, data);
+    await fs.rename(tmpFile, file);
+}
+
 // Save data to files
 async function saveData() {
     try {
-        await fs.writeFile(DEALS_FILE, JSON.stringify(currentDeals, null, 2));
-        await fs.writeFile(HISTORY_FILE, JSON.stringify(priceHistory, null, 2));
-        await fs.writeFile(SETTINGS_FILE, JSON.stringify(settings, null, 2));
+        await writeFileAtomic(DEALS_FILE, JSON.stringify(currentDeals));
+        await flushPriceLog();
+
+        if (countLogEntries() >= PRICE_LOG_COMPACT_THRESHOLD) {
+            await compactPriceHistory();
+        }
     } catch (error) {
         console.error('Error saving data:', error);
     }
 }
 
+async function saveSettings() {
+    await writeFileAtomic(SETTINGS_FILE, JSON.stringify(settings, null, 2));
+}
+
+// Price history store
+// Observations are appended to PRICE_LOG_FILE as one JSON object per line.
+// Compaction moves them into columnar snapshot segments, one directory per
+// route, so each compaction only writes the new observations. Segments are
+// named `${since}-${through}-${rows}.json` and hold the observations with
+// since < t <= through. Route histories are only read when first needed.
+let pendingObservations = []; // Recorded but not yet appended to the log
+let logEntriesByRoute = new Map(); // Observations in the on-disk log, by route
+const routeHistoryCache = new Map(); // Recently used route histories, oldest first
+let lastObservationTime = 0;
+let storeQueue = Promise.resolve();
+
+// Serialize log appends, compaction and route loading
+function enqueueStoreTask(task) {
+    const result = storeQueue.then(task);
+    storeQueue = result.catch(() => {});
+    return result;
+}
+
+function emptyRouteHistory(route) {
+    return { route: route, through: 0, t: [], depart: [], return: [], provider: [], price: [] };
+}
+
+function routeDir(route) {
+    return path.join(PRICE_SNAPSHOT_DIR, route.replace(/[^A-Za-z0-9-]/g, '_'));
+}
+
+function appendToRouteHistory(history, observation) {
+    history.t.push(observation.t);
+    history.depart.push(observation.depart);
+    history.return.push(observation.return);
+    history.provider.push(observation.provider);
+    history.price.push(observation.price);
+}
+
+function appendColumns(history, columns) {
+    for (let i = 0; i < columns.t.length; i++) {
+        history.t.push(columns.t[i]);
+        history.depart.push(columns.depart[i]);
+        history.return.push(columns.return[i]);
+        history.provider.push(columns.provider[i]);
+        history.price.push(columns.price[i]);
+    }
+}
+
+function cacheRouteHistory(route, history) {
+    routeHistoryCache.delete(route);
+    routeHistoryCache.set(route, history);
+    if (routeHistoryCache.size > ROUTE_CACHE_SIZE) {
+        routeHistoryCache.delete(routeHistoryCache.keys().next().value);
+    }
+}
+
+function countLogEntries() {
+    let count = pendingObservations.length;
+    for (const entries of logEntriesByRoute.values()) {
+        count += entries.length;
+    }
+    return count;
+}
+
+// Read the uncompacted log once at startup
+async function loadPriceLog() {
+    let logData;
+    try {
+        logData = await fs.readFile(PRICE_LOG_FILE, 'utf8');
+    } catch (err) {
+        return;
+    }
+
+    for (const line of logData.split('\n')) {
+        if (!line) continue;
+        try {
+            const observation = JSON.parse(line);
+            if (!logEntriesByRoute.has(observation.route)) {
+                logEntriesByRoute.set(observation.route, []);
+            }
+            logEntriesByRoute.get(observation.route).push(observation);
+            lastObservationTime = Math.max(lastObservationTime, observation.t);
+        } catch (err) {
+            // Ignore a partially written trailing line
+        }
+    }
+}
+
+// List a route's snapshot segments, oldest first. Segments already covered
+// by a merged segment (left behind by an interrupted merge) are returned as stale.
+async function listSegments(route) {
+    let files;
+    try {
+        files = await fs.readdir(routeDir(route));
+    } catch (err) {
+        return { live: [], stale: [] };
+    }
+
+    const segments = [];
+    for (const file of files) {
+        const match = file.match(/^(\d+)-(\d+)-(\d+)\.json$/);
+        if (match) {
+            segments.push({
+                file: path.join(routeDir(route), file),
+                since: Number(match[1]),
+                through: Number(match[2]),
+                rows: Number(match[3])
+            });
+        }
+    }
+
+    // A merged segment sorts before the segments it replaced
+    segments.sort((a, b) => a.since - b.since || b.through - a.through);
+
+    const live = [];
+    const stale = [];
+    for (const segment of segments) {
+        if (live.length === 0 || segment.since >= live[live.length - 1].through) {
+            live.push(segment);
+        } else {
+            stale.push(segment);
+        }
+    }
+    return { live: live, stale: stale };
+}
+
+async function readSegment(segment) {
+    const data = JSON.parse(await fs.readFile(segment.file, 'utf8'));
+    return { ...data, provider: data.provider.map(index => data.providers[index]) };
+}
+
+async function writeSegment(route, since, through, columns) {
+    // Dictionary-encode providers, they repeat on every row
+    const providers = Array.from(new Set(columns.provider));
+    const segment = {
+        route: route,
+        since: since,
+        through: through,
+        t: columns.t,
+        depart: columns.depart,
+        return: columns.return,
+        providers: providers,
+        provider: columns.provider.map(name => providers.indexOf(name)),
+        price: columns.price
+    };
+
+    await fs.mkdir(routeDir(route), { recursive: true });
+    await writeFileAtomic(path.join(routeDir(route), `${since}-${through}-${columns.t.length}.json`), JSON.stringify(segment));
+}
+
+function segmentTier(segment) {
+    return Math.floor(Math.log(Math.max(segment.rows, 1)) / Math.log(SEGMENT_MERGE_FANOUT));
+}
+
+// Oldest run of SEGMENT_MERGE_FANOUT or more consecutive segments in the same size tier
+function findMergeRun(segments) {
+    let start = 0;
+    for (let i = 1; i <= segments.length; i++) {
+        if (i === segments.length || segmentTier(segments[i]) !== segmentTier(segments[start])) {
+            if (i - start >= SEGMENT_MERGE_FANOUT) {
+                return segments.slice(start, i);
+            }
+            start = i;
+        }
+    }
+    return null;
+}
+
+// Size-tiered merging keeps the segment count logarithmic in the history
+// length while each observation is rewritten only a logarithmic number of times
+async function mergeSegments(route) {
+    let { live, stale } = await listSegments(route);
+    for (const segment of stale) {
+        await fs.unlink(segment.file);
+    }
+
+    let run = findMergeRun(live);
+    while (run) {
+        const merged = emptyRouteHistory(route);
+        for (const segment of run) {
+            appendColumns(merged, await readSegment(segment));
+        }
+        await writeSegment(route, run[0].since, run[run.length - 1].through, merged);
+        for (const segment of run) {
+            await fs.unlink(segment.file);
+        }
+
+        ({ live } = await listSegments(route));
+        run = findMergeRun(live);
+    }
+}
+
+// Load a route's full dated history (snapshot segments plus newer log entries)
+async function loadRouteHistory(route) {
+    if (routeHistoryCache.has(route)) {
+        const history = routeHistoryCache.get(route);
+        cacheRouteHistory(route, history);
+        return history;
+    }
+
+    return enqueueStoreTask(async () => {
+        // Another caller may have loaded the route while we were queued
+        if (routeHistoryCache.has(route)) {
+            return routeHistoryCache.get(route);
+        }
+
+        const history = emptyRouteHistory(route);
+        for (const segment of (await listSegments(route)).live) {
+            appendColumns(history, await readSegment(segment));
+            history.through = segment.through;
+        }
+
+        // Entries at or before `through` were already compacted into a segment
+        for (const observation of logEntriesByRoute.get(route) || []) {
+            if (observation.t > history.through) {
+                appendToRouteHistory(history, observation);
+            }
+        }
+        for (const observation of pendingObservations) {
+            if (observation.route === route) {
+                appendToRouteHistory(history, observation);
+            }
+        }
+
+        // Don't cache routes we know nothing about
+        if (history.t.length > 0) {
+            cacheRouteHistory(route, history);
+        }
+        return history;
+    });
+}
+
+function recordObservation(route, departDate, returnDate, provider, price) {
+    // Timestamps double as sequence numbers, so keep them strictly increasing
+    lastObservationTime = Math.max(Date.now(), lastObservationTime + 1);
+
+    const observation = {
+        t: lastObservationTime,
+        route: route,
+        depart: departDate,
+        return: returnDate,
+        provider: provider,
+        price: price
+    };
+
+    pendingObservations.push(observation);
+    if (routeHistoryCache.has(route)) {
+        appendToRouteHistory(routeHistoryCache.get(route), observation);
+    }
+}
+
+// Append pending observations to the log
+function flushPriceLog() {
+    return enqueueStoreTask(async () => {
+        if (pendingObservations.length === 0) return;
+
+        const observations = pendingObservations;
+        pendingObservations = [];
+        for (const observation of observations) {
+            if (!logEntriesByRoute.has(observation.route)) {
+                logEntriesByRoute.set(observation.route, []);
+            }
+            logEntriesByRoute.get(observation.route).push(observation);
+        }
+
+        await fs.appendFile(PRICE_LOG_FILE, observations.map(o => JSON.stringify(o)).join('\n') + '\n');
+    });
+}
+
+// Append the log to each route's snapshot segments and truncate it
+function compactPriceHistory() {
+    return enqueueStoreTask(async () => {
+        if (logEntriesByRoute.size === 0) return;
+
+        let through = 0;
+        for (const entries of logEntriesByRoute.values()) {
+            through = Math.max(through, entries[entries.length - 1].t);
+        }
+
+        for (const [route, entries] of logEntriesByRoute) {
+            // Skip entries a previous, interrupted compaction already wrote
+            const { live } = await listSegments(route);
+            const since = live.length > 0 ? live[live.length - 1].through : 0;
+            const columns = emptyRouteHistory(route);
+            for (const observation of entries) {
+                if (observation.t > since) {
+                    appendToRouteHistory(columns, observation);
+                }
+            }
+
+            if (columns.t.length > 0) {
+                await writeSegment(route, since, through, columns);
+                await mergeSegments(route);
+            }
+        }
+
+        const routes = logEntriesByRoute.size;
+        logEntriesByRoute = new Map();
+        await writeFileAtomic(PRICE_LOG_FILE, '');
+        console.log(`Compacted price history for ${routes} routes`);
+    });
+}
+
+// Price statistics engine
+// Each stats object keeps an exponentially weighted mean and variance and a
+// log-bucketed quantile sketch, all updated in O(1) per observation.
+const SKETCH_GAMMA = (1 + STATS_CONFIG.sketchAccuracy) / (1 - STATS_CONFIG.sketchAccuracy);
+const SKETCH_LOG_GAMMA = Math.log(SKETCH_GAMMA);
+const priceStats = new Map(); // `${route}` or `${route}|W${week}` -> stats
+
+function createSketch() {
+    return { bins: {}, count: 0 };
+}
+
+function sketchKey(price) {
+    return Math.ceil(Math.log(Math.max(price, 1)) / SKETCH_LOG_GAMMA);
+}
+
+function sketchValue(key) {
+    return 2 * Math.pow(SKETCH_GAMMA, key) / (SKETCH_GAMMA + 1);
+}
+
+function addToSketch(sketch, price) {
+    const key = sketchKey(price);
+    sketch.bins[key] = (sketch.bins[key] || 0) + 1;
+    sketch.count++;
+
+    // Halve all counts once the sketch holds two windows, so old prices fade out
+    if (sketch.count > 2 * STATS_CONFIG.window) {
+        for (const bin of Object.keys(sketch.bins)) {
+            sketch.bins[bin] /= 2;
+        }
+        sketch.count /= 2;
+    }
+}
+
+// Fraction of observed prices below `price` (bins iterate in ascending key order)
+function sketchPercentile(sketch, price) {
+    if (sketch.count === 0) return null;
+
+    const target = sketchKey(price);
+    let below = 0;
+    for (const key of Object.keys(sketch.bins)) {
+        const bin = Number(key);
+        if (bin < target) {
+            below += sketch.bins[key];
+        } else {
+            if (bin === target) below += sketch.bins[key] / 2;
+            break;
+        }
+    }
+    return below / sketch.count;
+}
+
+function sketchQuantile(sketch, q) {
+    if (sketch.count === 0) return null;
+
+    const target = q * sketch.count;
+    let seen = 0;
+    let last = null;
+    for (const key of Object.keys(sketch.bins)) {
+        seen += sketch.bins[key];
+        last = Number(key);
+        if (seen >= target) break;
+    }
+    return sketchValue(last);
+}
+
+function createStats() {
+    return { count: 0, mean: 0, variance: 0, sketch: createSketch() };
+}
+
+function updateStats(stats, price) {
+    stats.count++;
+
+    // Cumulative average until the window fills, exponentially weighted after
+    const alpha = Math.max(1 / stats.count, 1 / STATS_CONFIG.window);
+    const diff = price - stats.mean;
+    const increment = alpha * diff;
+    stats.mean += increment;
+    stats.variance = (1 - alpha) * (stats.variance + diff * increment);
+
+    addToSketch(stats.sketch, price);
+}
+
+// ISO week number of a YYYY-MM-DD date
+function getDepartureWeek(departDate) {
+    const date = new Date(`${departDate}T00:00:00Z`);
+    const day = date.getUTCDay() || 7;
+    date.setUTCDate(date.getUTCDate() + 4 - day);
+    const yearStart = new Date(Date.UTC(date.getUTCFullYear(), 0, 1));
+    return Math.ceil(((date - yearStart) / 86400000 + 1) / 7);
+}
+
+function getStats(key) {
+    if (!priceStats.has(key)) {
+        priceStats.set(key, createStats());
+    }
+    return priceStats.get(key);
+}
+
+function updatePriceStats(route, departDate, price) {
+    updateStats(getStats(route), price);
+    updateStats(getStats(`${route}|W${getDepartureWeek(departDate)}`), price);
+}
+
+// Rebuild a route's stats from its stored history
+async function rebuildRouteStats(route) {
+    for (const key of Array.from(priceStats.keys())) {
+        if (key === route || key.startsWith(`${route}|`)) {
+            priceStats.delete(key);
+        }
+    }
+
+    const history = await loadRouteHistory(route);
+    getStats(route);
+
+    // Prices from the undated legacy file always seed the route-level stats
+    // first, as they did when the route was first scored after an upgrade, so
+    // a restart rebuilds the same stats
+    if (legacyPriceHistory[route]) {
+        for (const price of legacyPriceHistory[route].prices) {
+            updateStats(getStats(route), price);
+        }
+    }
+
+    for (let i = 0; i < history.price.length; i++) {
+        updatePriceStats(route, history.depart[i], history.price[i]);
+    }
+}
+
+async function ensureRouteStats(route) {
+    if (!priceStats.has(route)) {
+        await rebuildRouteStats(route);
+    }
+}
+
+// Score a price against the departure week's stats, falling back to the route
+function scorePrice(route, departDate, price) {
+    const weekStats = priceStats.get(`${route}|W${getDepartureWeek(departDate)}`);
+    const routeStats = priceStats.get(route);
+
+    let stats = null;
+    if (weekStats && weekStats.count >= STATS_CONFIG.minWeekSamples) {
+        stats = weekStats;
+    } else if (routeStats && routeStats.count >= STATS_CONFIG.minRouteSamples) {
+        stats = routeStats;
+    }
+    if (!stats) return null;
+
+    const stdDev = Math.sqrt(stats.variance);
+    return {
+        mean: stats.mean,
+        percentile: sketchPercentile(stats.sketch, price),
+        zScore: stdDev > 0 ? (price - stats.mean) / stdDev : 0,
+        basis: stats === weekStats ? 'week' : 'route'
+    };
+}
+
+function isDeal(score) {
+    if (STATS_CONFIG.dealRule === 'zscore') {
+        return score.zScore <= STATS_CONFIG.dealZScore;
+    }
+    return score.percentile <= STATS_CONFIG.dealPercentile;
+}
+
 // Amadeus API Authentication
 let amadeusToken = null;
 let amadeusTokenExpiry = null;
 
-async function getAmadeusToken() {
+async function getAmadeusToken(signal) {
     if (amadeusToken && amadeusTokenExpiry && Date.now() < amadeusTokenExpiry) {
         return amadeusToken;
     }
@@ -116,7 +643,9 @@ async function getAmadeusToken() {
             {
                 headers: {
                     'Content-Type': 'application/x-www-form-urlencoded'
-                }
+                },
+                timeout: SEARCH_CONFIG.providerTimeoutMs,
+                signal: signal
             }
         );
 
@@ -124,17 +653,19 @@ async function getAmadeusToken() {
         amadeusTokenExpiry = Date.now() + (response.data.expires_in * 1000) - 60000; // Refresh 1 minute early
         return amadeusToken;
     } catch (error) {
-        console.error('Error getting Amadeus token:', error);
+        if (!axios.isCancel(error)) {
+            console.error('Error getting Amadeus token:', error);
+        }
         throw error;
     }
 }
 
 // Search flights using Amadeus API
-async function searchAmadeusFlights(from, to, departDate, returnDate) {
+async function searchAmadeusFlights(from, to, departDate, returnDate, signal) {
     if (!API_CONFIG.amadeus.enabled) return null;
 
     try {
-        const token = await getAmadeusToken();
+        const token = await getAmadeusToken(signal);
         const response = await axios.get(`${API_CONFIG.amadeus.baseUrl}/shopping/flight-offers`, {
             headers: {
                 'Authorization': `Bearer ${token}`
@@ -147,7 +678,9 @@ async function searchAmadeusFlights(from, to, departDate, returnDate) {
                 adults: 1,
                 currencyCode: 'USD',
                 max: 10
-            }
+            },
+            timeout: SEARCH_CONFIG.providerTimeoutMs,
+            signal: signal
         });
 
         return response.data.data.map(offer => ({
@@ -165,13 +698,15 @@ async function searchAmadeusFlights(from, to, departDate, returnDate) {
             url: `https://www.amadeus.com/flights/${from}/${to}`
         }));
     } catch (error) {
-        console.error('Amadeus API error:', error);
+        if (!axios.isCancel(error)) {
+            console.error('Amadeus API error:', error);
+        }
         return null;
     }
 }
 
 // Search flights using Skyscanner API
-async function searchSkyscannerFlights(from, to, departDate, returnDate) {
+async function searchSkyscannerFlights(from, to, departDate, returnDate, signal) {
     if (!API_CONFIG.skyscanner.enabled) return null;
 
     try {
@@ -184,7 +719,9 @@ async function searchSkyscannerFlights(from, to, departDate, returnDate) {
                 },
                 params: {
                     inboundpartialdate: returnDate
-                }
+                },
+                timeout: SEARCH_CONFIG.providerTimeoutMs,
+                signal: signal
             }
         );
 
@@ -203,13 +740,15 @@ async function searchSkyscannerFlights(from, to, departDate, returnDate) {
             url: `https://www.skyscanner.com/transport/flights/${from}/${to}/${departDate}/${returnDate}`
         }));
     } catch (error) {
-        console.error('Skyscanner API error:', error);
+        if (!axios.isCancel(error)) {
+            console.error('Skyscanner API error:', error);
+        }
         return null;
     }
 }
 
 // Search flights using Kiwi API
-async function searchKiwiFlights(from, to, departDate, returnDate) {
+async function searchKiwiFlights(from, to, departDate, returnDate, signal) {
     if (!API_CONFIG.kiwi.enabled) return null;
 
     try {
@@ -229,7 +768,9 @@ async function searchKiwiFlights(from, to, departDate, returnDate) {
                 curr: 'USD',
                 max_stopovers: 1,
                 limit: 10
-            }
+            },
+            timeout: SEARCH_CONFIG.providerTimeoutMs,
+            signal: signal
         });
 
         return response.data.data.map(flight => ({
@@ -247,7 +788,9 @@ async function searchKiwiFlights(from, to, departDate, returnDate) {
             url: flight.deep_link
         }));
     } catch (error) {
-        console.error('Kiwi API error:', error);
+        if (!axios.isCancel(error)) {
+            console.error('Kiwi API error:', error);
+        }
         return null;
     }
 }
@@ -290,31 +833,222 @@ function generateSimulatedFlights(from, to, departDate, returnDate) {
             returnTime: `${String(Math.floor(Math.random() * 24)).padStart(2, '0')}:${String(Math.floor(Math.random() * 60)).padStart(2, '0')}`,
             price: price,
             duration: duration,
-            url: bookingUrl
+            url: bookingUrl,
+            provider: 'simulated'
         });
     }
 
     return flights;
 }
 
-// Main flight search function
-async function searchFlights(from, to, departDate, returnDate) {
-    // Try APIs in order of preference
-    let results = null;
+// Flight providers in order of preference
+const PROVIDERS = [
+    { name: 'amadeus', search: searchAmadeusFlights },
+    { name: 'skyscanner', search: searchSkyscannerFlights },
+    { name: 'kiwi', search: searchKiwiFlights }
+];
+
+// Per-provider latency histograms and health
+const providerLatency = {};
+
+function getLatencyStats(provider) {
+    if (!providerLatency[provider]) {
+        providerLatency[provider] = {
+            counts: new Array(LATENCY_BUCKETS.length).fill(0),
+            total: 0,
+            censored: 0,
+            unfinished: 0, // Consecutive calls that were cancelled or timed out
+            demotedUntil: 0
+        };
+    }
+    return providerLatency[provider];
+}
 
-    // Try Amadeus first
-    if (API_CONFIG.amadeus.enabled) {
-        results = await searchAmadeusFlights(from, to, departDate, returnDate);
+// Only completed calls go into the histogram. A call cancelled by a winning
+// hedge only tells us the provider was slower than the hedge delay, and
+// counting it at its elapsed time would ratchet the delay up for a provider
+// that hangs. Cancelled and timed out calls instead count against the
+// provider's health: after `unhealthyAfter` in a row it is demoted.
+function recordLatency(provider, ms, censored = false) {
+    const stats = getLatencyStats(provider);
+
+    if (censored) {
+        stats.censored++;
+        stats.unfinished++;
+        if (stats.unfinished >= SEARCH_CONFIG.unhealthyAfter) {
+            stats.demotedUntil = Date.now() + SEARCH_CONFIG.demoteMs;
+        }
+        return;
     }
 
-    // Try Skyscanner if Amadeus fails
-    if (!results && API_CONFIG.skyscanner.enabled) {
-        results = await searchSkyscannerFlights(from, to, departDate, returnDate);
+    stats.unfinished = 0;
+    stats.demotedUntil = 0;
+
+    const bucket = LATENCY_BUCKETS.findIndex(bound => ms <= bound);
+    stats.counts[bucket]++;
+    stats.total++;
+
+    // Halve all counts once the histogram holds two windows, so a provider's
+    // old latencies fade out
+    if (stats.total > 2 * SEARCH_CONFIG.latencyWindow) {
+        stats.counts = stats.counts.map(count => count / 2);
+        stats.total /= 2;
     }
+}
+
+function isProviderHealthy(provider) {
+    const stats = providerLatency[provider];
+    return !stats || stats.demotedUntil <= Date.now();
+}
+
+function getLatencyPercentile(provider, percentile) {
+    const histogram = providerLatency[provider];
+    if (!histogram || histogram.total === 0) return null;
 
-    // Try Kiwi if others fail
-    if (!results && API_CONFIG.kiwi.enabled) {
-        results = await searchKiwiFlights(from, to, departDate, returnDate);
+    const target = Math.ceil(histogram.total * percentile);
+    let seen = 0;
+    for (let i = 0; i < histogram.counts.length; i++) {
+        seen += histogram.counts[i];
+        if (seen >= target) {
+            return LATENCY_BUCKETS[i];
+        }
+    }
+    return null;
+}
+
+// Wait for the provider's usual tail latency before hedging to the next one
+function getHedgeDelay(provider) {
+    const histogram = providerLatency[provider];
+    if (!histogram || histogram.total < SEARCH_CONFIG.minLatencySamples) {
+        return SEARCH_CONFIG.hedgeDelayMs;
+    }
+
+    const delay = getLatencyPercentile(provider, SEARCH_CONFIG.hedgePercentile);
+    return Math.min(Math.max(delay, SEARCH_CONFIG.minHedgeDelayMs), SEARCH_CONFIG.maxHedgeDelayMs);
+}
+
+// Query a single provider, tagging results and recording latency
+async function queryProvider(provider, from, to, departDate, returnDate, signal) {
+    const started = Date.now();
+    const results = await provider.search(from, to, departDate, returnDate, signal);
+    const elapsed = Date.now() - started;
+
+    if (results) {
+        recordLatency(provider.name, elapsed);
+        results.forEach(flight => { flight.provider = provider.name; });
+    } else if ((signal && signal.aborted) || elapsed >= SEARCH_CONFIG.providerTimeoutMs) {
+        recordLatency(provider.name, elapsed, true);
+    }
+
+    return results;
+}
+
+function getEnabledProviders() {
+    return PROVIDERS.filter(provider => API_CONFIG[provider.name].enabled);
+}
+
+// Try providers one after another until one succeeds
+async function searchSequential(providers, from, to, departDate, returnDate) {
+    for (const provider of providers) {
+        const results = await queryProvider(provider, from, to, departDate, returnDate);
+        if (results) return results;
+    }
+    return null;
+}
+
+// Start the primary, hedge to the next provider after a delay or on failure,
+// resolve with the first successful result and cancel the others. Demoted
+// providers are tried last until their demotion expires, then probed again.
+function searchHedged(providers, from, to, departDate, returnDate) {
+    providers = providers.filter(provider => isProviderHealthy(provider.name))
+        .concat(providers.filter(provider => !isProviderHealthy(provider.name)));
+
+    return new Promise(resolve => {
+        const controllers = [];
+        let next = 0;
+        let pending = 0;
+        let settled = false;
+        let hedgeTimer = null;
+
+        const finish = (results) => {
+            if (settled) return;
+            settled = true;
+            clearTimeout(hedgeTimer);
+            controllers.forEach(controller => controller.abort());
+            resolve(results);
+        };
+
+        const launch = () => {
+            if (settled || next >= providers.length) return;
+
+            const provider = providers[next++];
+            const controller = new AbortController();
+            controllers.push(controller);
+            pending++;
+
+            clearTimeout(hedgeTimer);
+            if (next < providers.length) {
+                hedgeTimer = setTimeout(launch, getHedgeDelay(provider.name));
+            }
+
+            queryProvider(provider, from, to, departDate, returnDate, controller.signal)
+                .catch(() => null)
+                .then(results => {
+                    pending--;
+                    if (results) {
+                        finish(results);
+                    } else if (next < providers.length) {
+                        launch();
+                    } else if (pending === 0) {
+                        finish(null);
+                    }
+                });
+        };
+
+        launch();
+    });
+}
+
+// Query all providers in parallel and union their results
+async function searchMerged(providers, from, to, departDate, returnDate) {
+    const responses = await Promise.all(
+        providers.map(provider => queryProvider(provider, from, to, departDate, returnDate).catch(() => null))
+    );
+
+    if (responses.every(results => !results)) return null;
+
+    // Keep the cheapest offer when providers return the same flight. Flight
+    // numbers are not stable across providers (Skyscanner's are made up), so
+    // match on airline and schedule instead.
+    const merged = new Map();
+    for (const results of responses) {
+        if (!results) continue;
+        for (const flight of results) {
+            const key = `${flight.airline}-${flight.departDate}-${flight.departTime}-${flight.returnDate}-${flight.returnTime}`;
+            const existing = merged.get(key);
+            if (!existing || flight.price < existing.price) {
+                merged.set(key, flight);
+            }
+        }
+    }
+
+    return Array.from(merged.values()).sort((a, b) => a.price - b.price);
+}
+
+// Main flight search function
+async function searchFlights(from, to, departDate, returnDate) {
+    const providers = getEnabledProviders();
+    let results = null;
+
+    if (providers.length > 0) {
+        // Hedging cancels calls with AbortController, which Node 14 lacks
+        if (SEARCH_CONFIG.mode === 'sequential' || (SEARCH_CONFIG.mode !== 'merge' && typeof AbortController === 'undefined')) {
+            results = await searchSequential(providers, from, to, departDate, returnDate);
+        } else if (SEARCH_CONFIG.mode === 'merge') {
+            results = await searchMerged(providers, from, to, departDate, returnDate);
+        } else {
+            results = await searchHedged(providers, from, to, departDate, returnDate);
+        }
     }
 
     // Fallback to simulated data
@@ -350,26 +1084,19 @@ async function scanForDeals() {
                         continue;
                     }
 
-                    // Update price history
+                    // Score against history so far, then record the price
                     const route = `${flight.from}-${flight.to}`;
-                    if (!priceHistory[route]) {
-                        priceHistory[route] = { prices: [], average: 0 };
-                    }
-
-                    priceHistory[route].prices.push(flight.price);
-                    
-                    // Keep only last 52 weeks of data
-                    if (priceHistory[route].prices.length > 52) {
-                        priceHistory[route].prices.shift();
-                    }
+                    await ensureRouteStats(route);
+                    const score = scorePrice(route, flight.departDate, flight.price);
 
-                    // Calculate average
-                    const avg = priceHistory[route].prices.reduce((a, b) => a + b, 0) / priceHistory[route].prices.length;
-                    priceHistory[route].average = avg;
+                    recordObservation(route, flight.departDate, flight.returnDate, flight.provider, flight.price);
+                    updatePriceStats(route, flight.departDate, flight.price);
 
                     // Check if this is a deal
-                    if (flight.price < avg * 0.9) { // 10% below average
-                        flight.dealScore = (avg - flight.price) / avg;
+                    if (score && flight.price < score.mean && isDeal(score)) {
+                        flight.dealScore = (score.mean - flight.price) / score.mean;
+                        flight.percentile = score.percentile;
+                        flight.zScore = score.zScore;
                         deals.push(flight);
                     }
                 }
@@ -490,15 +1217,74 @@ app.get('/api/settings', (req, res) => {
 app.post('/api/settings', async (req, res) => {
     try {
         settings = { ...settings, ...req.body };
-        await saveData();
+        await saveSettings();
         res.json({ success: true });
     } catch (error) {
         res.status(500).json({ error: 'Failed to save settings' });
     }
 });
 
+app.get('/api/provider-latency', (req, res) => {
+    const stats = {};
+    for (const provider of Object.keys(providerLatency)) {
+        stats[provider] = {
+            samples: providerLatency[provider].total,
+            censored: providerLatency[provider].censored,
+            healthy: isProviderHealthy(provider),
+            p50: getLatencyPercentile(provider, 0.5),
+            p95: getLatencyPercentile(provider, 0.95),
+            hedgeDelay: getHedgeDelay(provider)
+        };
+    }
+    res.json({ mode: SEARCH_CONFIG.mode, providers: stats });
+});
+
 app.get('/api/price-history', (req, res) => {
-    res.json(priceHistory);
+    const summary = {};
+    for (const [route, stats] of priceStats) {
+        if (route.includes('|') || stats.count === 0) continue;
+
+        const history = routeHistoryCache.get(route);
+        summary[route] = {
+            prices: history && history.price.length > 0 ? history.price.slice(-52) : (legacyPriceHistory[route] || {}).prices || [],
+            average: stats.mean,
+            stdDev: Math.sqrt(stats.variance),
+            p10: sketchQuantile(stats.sketch, 0.1),
+            p50: sketchQuantile(stats.sketch, 0.5),
+            p90: sketchQuantile(stats.sketch, 0.9),
+            samples: stats.count
+        };
+    }
+
+    // Routes not scanned since startup are still shown from the legacy file
+    for (const route of Object.keys(legacyPriceHistory)) {
+        if (!summary[route]) {
+            summary[route] = legacyPriceHistory[route];
+        }
+    }
+
+    res.json(summary);
+});
+
+app.get('/api/price-history/:route', async (req, res) => {
+    const route = req.params.route.toUpperCase();
+    if (!/^[A-Z]{3}-[A-Z]{3}$/.test(route)) {
+        return res.status(400).json({ error: 'Route must look like LAX-JFK' });
+    }
+
+    try {
+        const history = await loadRouteHistory(route);
+        res.json(history.t.map((t, i) => ({
+            timestamp: new Date(t).toISOString(),
+            departDate: history.depart[i],
+            returnDate: history.return[i],
+            provider: history.provider[i],
+            price: history.price[i]
+        })));
+    } catch (error) {
+        console.error('Price history error:', error);
+        res.status(500).json({ error: 'Failed to load price history' });
+    }
 });
 
 app.post('/api/refresh', async (req, res) => {
@@ -587,6 +1373,10 @@ async function start() {
         console.log('- Amadeus:', API_CONFIG.amadeus.enabled ? 'Enabled' : 'Disabled');
         console.log('- Skyscanner:', API_CONFIG.skyscanner.enabled ? 'Enabled' : 'Disabled');
         console.log('- Kiwi:', API_CONFIG.kiwi.enabled ? 'Enabled' : 'Disabled');
+        console.log('- Search mode:', SEARCH_CONFIG.mode);
+        if (SEARCH_CONFIG.mode === 'hedged' && typeof AbortController === 'undefined') {
+            console.warn('WARNING: AbortController is not available (Node 15+), searching providers sequentially.');
+        }
         
         if (!API_CONFIG.amadeus.enabled && !API_CONFIG.skyscanner.enabled && !API_CONFIG.kiwi.enabled) {
             console.warn('WARNING: No flight APIs configured. Using simulated data only.');
@@ -614,18 +1404,54 @@ async function start() {
     }
 }
 
-// Start the application
-start();
+// Start the application when run directly (tests require the module)
+if (require.main === module) {
+    start();
 
-// Handle graceful shutdown
-process.on('SIGTERM', async () => {
-    console.log('SIGTERM received. Shutting down gracefully...');
-    await saveData();
-    process.exit(0);
-});
+    // Handle graceful shutdown
+    process.on('SIGTERM', async () => {
+        console.log('SIGTERM received. Shutting down gracefully...');
+        await saveData();
+        process.exit(0);
+    });
+
+    process.on('SIGINT', async () => {
+        console.log('SIGINT received. Shutting down gracefully...');
+        await saveData();
+        process.exit(0);
+    });
+}
 
-process.on('SIGINT', async () => {
-    console.log('SIGINT received. Shutting down gracefully...');
-    await saveData();
-    process.exit(0);
-});
\ No newline at end of file
+module.exports = {
+    app,
+    initDataDirectory,
+    saveData,
+    recordObservation,
+    flushPriceLog,
+    compactPriceHistory,
+    loadRouteHistory,
+    listSegments,
+    routeHistoryCache,
+    STATS_CONFIG,
+    priceStats,
+    createSketch,
+    addToSketch,
+    sketchPercentile,
+    sketchQuantile,
+    createStats,
+    updateStats,
+    getDepartureWeek,
+    updatePriceStats,
+    rebuildRouteStats,
+    scorePrice,
+    isDeal,
+    SEARCH_CONFIG,
+    providerLatency,
+    recordLatency,
+    getLatencyPercentile,
+    getHedgeDelay,
+    isProviderHealthy,
+    searchSequential,
+    searchHedged,
+    searchMerged
+};
\ No newline at end of file
@@ -41,6 +41,11 @@ SKYSCANNER_API_KEY=
 # Get your API key at: https://tequila.kiwi.com/portal/login
 KIWI_API_KEY=
 
+# Provider search strategy: hedged (default), sequential or merge
+SEARCH_MODE=hedged
+PROVIDER_TIMEOUT_MS=15000
+HEDGE_DELAY_MS=2000
+
 # Email Configuration (for notifications)
 EMAIL_SERVICE=gmail
 EMAIL_USER=
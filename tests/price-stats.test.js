@@ -0,0 +1,159 @@
+// Streaming price statistics: EW mean/variance, quantile sketch and scoring
+
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+
+let server;
+let dataDir;
+
+beforeEach(async () => {
+    dataDir = fs.mkdtempSync(path.join(os.tmpdir(), 'price-stats-'));
+    process.env.DATA_DIR = dataDir;
+    server = await restartServer();
+});
+
+// Require a fresh server module, as a restarted process would see it
+async function restartServer() {
+    jest.resetModules();
+    const restarted = require('../server');
+    await restarted.initDataDirectory();
+    return restarted;
+}
+
+function expectSameStats(expected) {
+    expect(server.priceStats.size).toBe(expected.size);
+    for (const [key, stats] of expected) {
+        const rebuilt = server.priceStats.get(key);
+        expect(rebuilt.count).toBe(stats.count);
+        expect(rebuilt.mean).toBeCloseTo(stats.mean, 9);
+        expect(rebuilt.variance).toBeCloseTo(stats.variance, 9);
+        expect(rebuilt.sketch.bins).toEqual(stats.sketch.bins);
+    }
+}
+
+afterEach(() => {
+    fs.rmSync(dataDir, { recursive: true, force: true });
+    delete process.env.DATA_DIR;
+});
+
+describe('updateStats', () => {
+    test('matches the exact mean and variance until the window fills', () => {
+        const prices = [120, 80, 150, 99, 101, 230, 175];
+        const stats = server.createStats();
+        prices.forEach(price => server.updateStats(stats, price));
+
+        const mean = prices.reduce((a, b) => a + b, 0) / prices.length;
+        const variance = prices.reduce((a, b) => a + (b - mean) ** 2, 0) / prices.length;
+        expect(stats.count).toBe(prices.length);
+        expect(stats.mean).toBeCloseTo(mean, 6);
+        expect(stats.variance).toBeCloseTo(variance, 6);
+    });
+
+    test('follows a level shift once the window is full', () => {
+        const stats = server.createStats();
+        const window = server.STATS_CONFIG.window;
+        for (let i = 0; i < window; i++) server.updateStats(stats, 100);
+        for (let i = 0; i < 3 * window; i++) server.updateStats(stats, 200);
+
+        expect(stats.mean).toBeGreaterThan(190);
+        expect(stats.mean).toBeLessThan(200);
+    });
+});
+
+describe('quantile sketch', () => {
+    test('estimates percentiles and quantiles within its accuracy', () => {
+        const sketch = server.createSketch();
+        for (let price = 1; price <= 800; price++) server.addToSketch(sketch, price);
+
+        expect(Math.abs(server.sketchPercentile(sketch, 80) - 0.1)).toBeLessThan(0.01);
+        expect(Math.abs(server.sketchPercentile(sketch, 400) - 0.5)).toBeLessThan(0.01);
+        expect(Math.abs(server.sketchQuantile(sketch, 0.5) / 400 - 1)).toBeLessThan(0.02);
+        expect(Math.abs(server.sketchQuantile(sketch, 0.9) / 720 - 1)).toBeLessThan(0.02);
+    });
+
+    test('halves old counts so the sketch stays bounded', () => {
+        const sketch = server.createSketch();
+        const limit = 2 * server.STATS_CONFIG.window;
+        for (let i = 0; i < 5 * limit; i++) server.addToSketch(sketch, 100);
+
+        expect(sketch.count).toBeLessThanOrEqual(limit);
+        expect(server.sketchPercentile(sketch, 50)).toBe(0);
+        expect(server.sketchPercentile(sketch, 500)).toBe(1);
+    });
+
+    test('returns null when empty', () => {
+        expect(server.sketchPercentile(server.createSketch(), 100)).toBeNull();
+    });
+});
+
+describe('getDepartureWeek', () => {
+    test('returns the ISO week', () => {
+        expect(server.getDepartureWeek('2026-01-01')).toBe(1);
+        expect(server.getDepartureWeek('2026-11-06')).toBe(45);
+        expect(server.getDepartureWeek('2027-01-01')).toBe(53);
+        expect(server.getDepartureWeek('2024-12-30')).toBe(1);
+    });
+});
+
+describe('scorePrice', () => {
+    test('falls back from the departure week to the route', () => {
+        const route = 'LAX-JFK';
+        expect(server.scorePrice(route, '2026-11-06', 100)).toBeNull();
+
+        for (let i = 0; i < 6; i++) server.updatePriceStats(route, '2026-11-13', 200 + i);
+        expect(server.scorePrice(route, '2026-11-06', 100).basis).toBe('route');
+
+        for (let i = 0; i < 10; i++) server.updatePriceStats(route, '2026-11-06', 150 + i);
+        const score = server.scorePrice(route, '2026-11-06', 140);
+        expect(score.basis).toBe('week');
+        expect(score.percentile).toBe(0);
+        expect(score.zScore).toBeLessThan(0);
+        expect(server.isDeal(score)).toBe(true);
+        expect(server.isDeal(server.scorePrice(route, '2026-11-06', 155))).toBe(false);
+    });
+});
+
+describe('rebuildRouteStats', () => {
+    test('rebuilds the same stats from stored history', async () => {
+        const route = 'LAX-JFK';
+        const departs = ['2026-11-06', '2026-11-13', '2026-11-20'];
+        const incremental = new Map();
+
+        for (let i = 0; i < 60; i++) {
+            const price = 100 + ((i * 37) % 50);
+            const depart = departs[i % departs.length];
+            server.recordObservation(route, depart, depart, 'kiwi', price);
+            server.updatePriceStats(route, depart, price);
+        }
+        for (const [key, stats] of server.priceStats) incremental.set(key, { ...stats });
+
+        await server.saveData();
+        await server.compactPriceHistory();
+        await server.rebuildRouteStats(route);
+
+        expectSameStats(incremental);
+    });
+
+    test('keeps seeding from the legacy file after a restart', async () => {
+        const route = 'LAX-JFK';
+        const legacy = { [route]: { prices: [300, 280, 310, 295, 305, 290], average: 296.7 } };
+        fs.writeFileSync(path.join(dataDir, 'price-history.json'), JSON.stringify(legacy));
+        server = await restartServer();
+
+        // First scan after the upgrade: legacy prices, then new observations
+        await server.rebuildRouteStats(route);
+        for (let i = 0; i < 4; i++) {
+            server.recordObservation(route, '2026-11-06', '2026-11-08', 'kiwi', 150 + i);
+            server.updatePriceStats(route, '2026-11-06', 150 + i);
+        }
+        const incremental = new Map();
+        for (const [key, stats] of server.priceStats) incremental.set(key, { ...stats });
+        await server.saveData();
+
+        server = await restartServer();
+        await server.rebuildRouteStats(route);
+        expect(server.priceStats.get(route).count).toBe(10);
+        expectSameStats(incremental);
+    });
+});
@@ -0,0 +1,139 @@
+// Append-only price history store: log, snapshot segments and recovery
+
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+
+let dataDir;
+
+// Require a fresh server module, as a restarted process would see it
+async function startServer() {
+    jest.resetModules();
+    process.env.DATA_DIR = dataDir;
+    const server = require('../server');
+    await server.initDataDirectory();
+    return server;
+}
+
+function readLog() {
+    return fs.readFileSync(path.join(dataDir, 'price-log.ndjson'), 'utf8');
+}
+
+beforeEach(() => {
+    dataDir = fs.mkdtempSync(path.join(os.tmpdir(), 'price-store-'));
+});
+
+afterEach(() => {
+    fs.rmSync(dataDir, { recursive: true, force: true });
+    delete process.env.DATA_DIR;
+});
+
+describe('price history store', () => {
+    test('keeps observations recorded before the route was loaded', async () => {
+        let server = await startServer();
+
+        server.recordObservation('LAX-JFK', '2026-11-06', '2026-11-08', 'kiwi', 100);
+        const history = await server.loadRouteHistory('LAX-JFK');
+        for (let price = 101; price <= 104; price++) {
+            server.recordObservation('LAX-JFK', '2026-11-06', '2026-11-08', 'kiwi', price);
+        }
+        expect(history.price).toEqual([100, 101, 102, 103, 104]);
+
+        await server.saveData();
+        await server.compactPriceHistory();
+        expect(readLog()).toBe('');
+
+        server = await startServer();
+        const reloaded = await server.loadRouteHistory('LAX-JFK');
+        expect(reloaded.price).toEqual([100, 101, 102, 103, 104]);
+        expect(reloaded.provider).toEqual(['kiwi', 'kiwi', 'kiwi', 'kiwi', 'kiwi']);
+        expect(reloaded.depart[0]).toBe('2026-11-06');
+    });
+
+    test('reloads uncompacted observations from the log', async () => {
+        let server = await startServer();
+        server.recordObservation('LAX-JFK', '2026-11-06', '2026-11-08', 'kiwi', 100);
+        server.recordObservation('LAX-MIA', '2026-11-06', '2026-11-08', 'amadeus', 200);
+        await server.saveData();
+
+        // A crash can leave a partially written last line
+        fs.appendFileSync(path.join(dataDir, 'price-log.ndjson'), '{"t":9');
+
+        server = await startServer();
+        expect((await server.loadRouteHistory('LAX-JFK')).price).toEqual([100]);
+        expect((await server.loadRouteHistory('LAX-MIA')).price).toEqual([200]);
+    });
+
+    test('does not duplicate rows when the log survives an interrupted compaction', async () => {
+        let server = await startServer();
+        server.recordObservation('LAX-JFK', '2026-11-06', '2026-11-08', 'kiwi', 100);
+        server.recordObservation('LAX-JFK', '2026-11-13', '2026-11-15', 'kiwi', 110);
+        await server.saveData();
+        const log = readLog();
+        await server.compactPriceHistory();
+
+        // Simulate a crash after the segment was written but before truncation
+        fs.writeFileSync(path.join(dataDir, 'price-log.ndjson'), log);
+
+        server = await startServer();
+        expect((await server.loadRouteHistory('LAX-JFK')).price).toEqual([100, 110]);
+
+        server.recordObservation('LAX-JFK', '2026-11-20', '2026-11-22', 'kiwi', 120);
+        await server.saveData();
+        await server.compactPriceHistory();
+
+        server = await startServer();
+        expect((await server.loadRouteHistory('LAX-JFK')).price).toEqual([100, 110, 120]);
+    });
+
+    test('compaction appends a segment instead of rewriting the route', async () => {
+        const server = await startServer();
+        server.recordObservation('LAX-JFK', '2026-11-06', '2026-11-08', 'kiwi', 100);
+        await server.saveData();
+        await server.compactPriceHistory();
+
+        const [first] = (await server.listSegments('LAX-JFK')).live;
+        const firstContents = fs.readFileSync(first.file, 'utf8');
+
+        server.recordObservation('LAX-JFK', '2026-11-13', '2026-11-15', 'kiwi', 110);
+        await server.saveData();
+        await server.compactPriceHistory();
+
+        const { live } = await server.listSegments('LAX-JFK');
+        expect(live).toHaveLength(2);
+        expect(live[1].rows).toBe(1);
+        expect(fs.readFileSync(first.file, 'utf8')).toBe(firstContents);
+    });
+
+    test('merges small segments once enough accumulate', async () => {
+        let server = await startServer();
+        for (let i = 0; i < 9; i++) {
+            server.recordObservation('LAX-JFK', '2026-11-06', '2026-11-08', 'kiwi', 100 + i);
+            await server.saveData();
+            await server.compactPriceHistory();
+        }
+
+        const { live } = await server.listSegments('LAX-JFK');
+        expect(live.map(segment => segment.rows)).toEqual([8, 1]);
+
+        server = await startServer();
+        expect((await server.loadRouteHistory('LAX-JFK')).price).toEqual([100, 101, 102, 103, 104, 105, 106, 107, 108]);
+    });
+
+    test('does not cache unknown routes and bounds the cache', async () => {
+        const server = await startServer();
+
+        const unknown = await server.loadRouteHistory('AAA-BBB');
+        expect(unknown.price).toEqual([]);
+        expect(server.routeHistoryCache.has('AAA-BBB')).toBe(false);
+
+        for (let i = 0; i < 250; i++) {
+            const route = `LAX-${String(i).padStart(3, '0')}`;
+            server.recordObservation(route, '2026-11-06', '2026-11-08', 'kiwi', 100);
+            await server.loadRouteHistory(route);
+        }
+        expect(server.routeHistoryCache.size).toBe(200);
+        expect(server.routeHistoryCache.has('LAX-000')).toBe(false);
+        expect((await server.loadRouteHistory('LAX-000')).price).toEqual([100]);
+    });
+});
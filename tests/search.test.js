@@ -0,0 +1,184 @@
+// Provider search strategies: hedging, merging and latency tracking
+
+let server;
+
+beforeEach(() => {
+    jest.resetModules();
+    server = require('../server');
+    server.SEARCH_CONFIG.hedgeDelayMs = 30;
+    server.SEARCH_CONFIG.providerTimeoutMs = 1000;
+});
+
+const delay = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Fake provider resolving after `ms` with `results`, or null when aborted
+function fakeProvider(name, ms, results) {
+    const provider = {
+        name: name,
+        calls: 0,
+        aborted: false,
+        search: (from, to, departDate, returnDate, signal) => {
+            provider.calls++;
+            return new Promise(resolve => {
+                const timer = setTimeout(() => resolve(results && results.map(flight => ({ ...flight }))), ms);
+                if (signal) {
+                    signal.addEventListener('abort', () => {
+                        provider.aborted = true;
+                        clearTimeout(timer);
+                        resolve(null);
+                    });
+                }
+            });
+        }
+    };
+    return provider;
+}
+
+const flight = (airline, price, extra = {}) => ({
+    airline: airline,
+    flight: `${airline}${Math.floor(Math.random() * 1000)}`,
+    departDate: '2026-11-06',
+    departTime: '08:00',
+    returnDate: '2026-11-08',
+    returnTime: '18:00',
+    price: price,
+    ...extra
+});
+
+describe('searchHedged', () => {
+    test('does not hedge when the primary answers before the hedge delay', async () => {
+        const primary = fakeProvider('primary', 5, [flight('AA', 100)]);
+        const backup = fakeProvider('backup', 5, [flight('UA', 90)]);
+
+        const results = await server.searchHedged([primary, backup], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+        await delay(50);
+
+        expect(results[0].provider).toBe('primary');
+        expect(backup.calls).toBe(0);
+    });
+
+    test('takes the backup result when the primary is slow and cancels the primary', async () => {
+        const primary = fakeProvider('primary', 500, [flight('AA', 100)]);
+        const backup = fakeProvider('backup', 10, [flight('UA', 90)]);
+
+        const started = Date.now();
+        const results = await server.searchHedged([primary, backup], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+
+        expect(results[0].provider).toBe('backup');
+        expect(Date.now() - started).toBeLessThan(300);
+        expect(primary.aborted).toBe(true);
+    });
+
+    test('launches the backup immediately when the primary fails', async () => {
+        server.SEARCH_CONFIG.hedgeDelayMs = 5000;
+        const primary = fakeProvider('primary', 5, null);
+        const backup = fakeProvider('backup', 5, [flight('UA', 90)]);
+
+        const started = Date.now();
+        const results = await server.searchHedged([primary, backup], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+
+        expect(results[0].provider).toBe('backup');
+        expect(Date.now() - started).toBeLessThan(1000);
+    });
+
+    test('resolves null when every provider fails', async () => {
+        const providers = [fakeProvider('a', 5, null), fakeProvider('b', 50, null), fakeProvider('c', 5, null)];
+
+        const results = await server.searchHedged(providers, 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+
+        expect(results).toBeNull();
+        expect(providers.every(provider => provider.calls === 1)).toBe(true);
+    });
+});
+
+describe('latency tracking', () => {
+    test('records cancelled calls as censored, outside the histogram', async () => {
+        const primary = fakeProvider('primary', 500, [flight('AA', 100)]);
+        const backup = fakeProvider('backup', 10, [flight('UA', 90)]);
+
+        await server.searchHedged([primary, backup], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+
+        expect(server.providerLatency.primary.total).toBe(0);
+        expect(server.providerLatency.primary.censored).toBe(1);
+        expect(server.providerLatency.backup.total).toBe(1);
+        expect(server.getHedgeDelay('primary')).toBe(server.SEARCH_CONFIG.hedgeDelayMs);
+    });
+
+    test('hedge delay follows the provider p95 within bounds', () => {
+        for (let i = 0; i < 19; i++) server.recordLatency('p', 40);
+        expect(server.getHedgeDelay('p')).toBe(server.SEARCH_CONFIG.hedgeDelayMs);
+
+        server.recordLatency('p', 40);
+        expect(server.getHedgeDelay('p')).toBe(server.SEARCH_CONFIG.minHedgeDelayMs);
+
+        for (let i = 0; i < 20; i++) server.recordLatency('p', 900, true);
+        expect(server.getHedgeDelay('p')).toBe(server.SEARCH_CONFIG.minHedgeDelayMs);
+
+        for (let i = 0; i < 20; i++) server.recordLatency('p', 900);
+        expect(server.getHedgeDelay('p')).toBe(1000);
+
+        for (let i = 0; i < 200; i++) server.recordLatency('p', 60000);
+        expect(server.getHedgeDelay('p')).toBe(server.SEARCH_CONFIG.maxHedgeDelayMs);
+    });
+
+    test('old latencies fade out', () => {
+        const window = server.SEARCH_CONFIG.latencyWindow;
+        for (let i = 0; i < 2 * window; i++) server.recordLatency('p', 60000);
+        for (let i = 0; i < 6 * window; i++) server.recordLatency('p', 40);
+
+        expect(server.providerLatency.p.total).toBeLessThanOrEqual(2 * window);
+        expect(server.getHedgeDelay('p')).toBe(server.SEARCH_CONFIG.minHedgeDelayMs);
+    });
+
+    test('a hanging primary does not push the hedge delay up', async () => {
+        const primary = fakeProvider('primary', 60000, [flight('AA', 100)]);
+        const backup = fakeProvider('backup', 5, [flight('UA', 90)]);
+        const searches = server.SEARCH_CONFIG.minLatencySamples + 5;
+
+        for (let i = 0; i < searches; i++) {
+            const results = await server.searchHedged([primary, backup], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+            expect(results[0].provider).toBe('backup');
+            expect(server.getHedgeDelay('primary')).toBe(server.SEARCH_CONFIG.hedgeDelayMs);
+        }
+
+        // Demoted after `unhealthyAfter` cancellations, then only the backup is asked
+        expect(server.isProviderHealthy('primary')).toBe(false);
+        expect(primary.calls).toBe(server.SEARCH_CONFIG.unhealthyAfter);
+        expect(backup.calls).toBe(searches);
+    });
+
+    test('probes a demoted provider again once the demotion expires', async () => {
+        server.SEARCH_CONFIG.demoteMs = 50;
+        const primary = fakeProvider('primary', 60000, [flight('AA', 100)]);
+        const backup = fakeProvider('backup', 5, [flight('UA', 90)]);
+        for (let i = 0; i < server.SEARCH_CONFIG.unhealthyAfter; i++) {
+            await server.searchHedged([primary, backup], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+        }
+        expect(server.isProviderHealthy('primary')).toBe(false);
+
+        await delay(60);
+        const recovered = fakeProvider('primary', 5, [flight('AA', 100)]);
+        const results = await server.searchHedged([recovered, backup], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+
+        expect(results[0].provider).toBe('primary');
+        expect(server.isProviderHealthy('primary')).toBe(true);
+    });
+});
+
+describe('searchMerged', () => {
+    test('unions providers and keeps the cheapest copy of the same flight', async () => {
+        const a = fakeProvider('a', 5, [flight('AA', 120), flight('DL', 200)]);
+        const b = fakeProvider('b', 10, [flight('AA', 110), flight('UA', 150, { departTime: '09:30' })]);
+        const c = fakeProvider('c', 5, null);
+
+        const results = await server.searchMerged([a, b, c], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+
+        expect(results.map(result => [result.airline, result.price])).toEqual([['AA', 110], ['UA', 150], ['DL', 200]]);
+        expect(results[0].provider).toBe('b');
+    });
+
+    test('resolves null when every provider fails', async () => {
+        const results = await server.searchMerged([fakeProvider('a', 5, null)], 'LAX', 'JFK', '2026-11-06', '2026-11-08');
+        expect(results).toBeNull();
+    });
+});